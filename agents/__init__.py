@@ -1,9 +1,21 @@
 # agents/__init__.py
 """Agentic RAG Chatbot - Agent Package"""
 
+import importlib
+
 from .base_agent import BaseAgent
-from .ingestion_agent import IngestionAgent
-from .retrieval_agent import RetrievalAgent
-from .llm_response_agent import LLMResponseAgent
 
 __all__ = ['BaseAgent', 'IngestionAgent', 'RetrievalAgent', 'LLMResponseAgent']
+
+# The agents pull in torch, chromadb and the Gemini client; import each on first use
+_LAZY_AGENTS = {
+    'IngestionAgent': '.ingestion_agent',
+    'RetrievalAgent': '.retrieval_agent',
+    'LLMResponseAgent': '.llm_response_agent'
+}
+
+def __getattr__(name):
+    module = _LAZY_AGENTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
@@ -10,6 +10,7 @@ class BaseAgent(ABC):
     def __init__(self, name: str):
         self.name = name
         self.message_bus = message_bus
+        self._send = message_bus.send_message
         
         # Subscribe to message bus
         self.message_bus.subscribe(self.name, self.handle_message)
@@ -29,7 +30,7 @@ class BaseAgent(ABC):
             payload=payload,
             trace_id=trace_id
         )
-        await self.message_bus.send_message(message)
+        self._send(message)
     
     def log(self, message: str, level: str = "INFO") -> None:
         """Simple logging mechanism"""
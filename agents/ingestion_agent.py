@@ -1,16 +1,20 @@
 """Ingestion Agent for Document Processing"""
 
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, Optional
 from agents.base_agent import BaseAgent
+from agents.retrieval_agent import RetrievalAgent
 from core.mcp import MCPMessage, MessageType
 from core.document_parser import DocumentParser
 
 class IngestionAgent(BaseAgent):
     """Agent responsible for document ingestion and parsing"""
     
-    def __init__(self):
+    def __init__(self, retrieval_agent: Optional[RetrievalAgent] = None):
         super().__init__("IngestionAgent")
         self.parser = DocumentParser()
+        # In-process RetrievalAgent to hand chunks to directly, skipping the bus
+        self.retrieval_agent = retrieval_agent
     
     async def handle_message(self, message: MCPMessage) -> None:
         """Handle incoming messages"""
@@ -27,26 +31,43 @@ class IngestionAgent(BaseAgent):
         """Process uploaded document"""
         payload = message.payload
         file_name = payload.get('file_name')
-        file_data = payload.get('file_data')
+        # Either raw bytes or an in-process binary stream (avoids copying uploads)
+        file_data = payload.get('file_data') or payload.get('file_stream')
         
         if not file_name or not file_data:
             raise ValueError("Missing file_name or file_data in payload")
         
         self.log(f"Processing document: {file_name}")
         
-        # Parse document into chunks
-        chunks = self.parser.parse_document(file_data, file_name)
+        # Parse document into chunks off the event loop so other agents keep running
+        chunks = await asyncio.to_thread(self.parser.parse_document, file_data, file_name)
         
         self.log(f"Extracted {len(chunks)} chunks from {file_name}")
         
         # Send chunks to RetrievalAgent
+        if self.retrieval_agent is not None:
+            await self.retrieval_agent.ingest_chunks(chunks, file_name)
+            
+            # Let the uploader know the document is searchable
+            await self.send_message(
+                receiver=message.sender,
+                msg_type=MessageType.DOC_INGESTED,
+                payload={
+                    "file_name": file_name,
+                    "total_chunks": len(chunks)
+                },
+                trace_id=message.trace_id
+            )
+            return
+        
         await self.send_message(
             receiver="RetrievalAgent",
             msg_type=MessageType.DOC_INGESTED,
             payload={
                 "chunks": chunks,
                 "file_name": file_name,
-                "total_chunks": len(chunks)
+                "total_chunks": len(chunks),
+                "reply_to": message.sender
             },
             trace_id=message.trace_id
         )
@@ -1,11 +1,18 @@
 """LLM Response Agent for Answer Generation"""
 
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator
 import google.generativeai as genai
 from agents.base_agent import BaseAgent
 from core.mcp import MCPMessage, MessageType
 from config.settings import get_settings
 
+LLM_MODEL = 'gemini-1.5-flash-latest'
+SYSTEM_PROMPT = """Based on the following context from uploaded documents, answer the user's question. 
+Be accurate, concise, and cite the sources when possible."""
+
+# Rough characters-per-token ratio used to estimate prompt size without a tokenizer
+CHARS_PER_TOKEN = 4
+
 class LLMResponseAgent(BaseAgent):
     """Agent responsible for generating responses using LLM"""
     
@@ -19,7 +26,7 @@ class LLMResponseAgent(BaseAgent):
         api_key = self.settings.get('GOOGLE_API_KEY')
         if api_key:
             genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash-latest')
+            self.model = genai.GenerativeModel(LLM_MODEL, system_instruction=SYSTEM_PROMPT)
             self.llm_available = True
             self.log("Gemini LLM initialized")
         else:
@@ -33,6 +40,14 @@ class LLMResponseAgent(BaseAgent):
                 await self._process_user_query(message)
             elif message.type == MessageType.RETRIEVAL_RESULT:
                 await self._generate_response(message)
+            elif message.type == MessageType.ERROR:
+                # Retrieval failed; pass the error on so the UI stops waiting
+                await self.send_message(
+                    receiver="UI",
+                    msg_type=MessageType.ERROR,
+                    payload=message.payload,
+                    trace_id=message.trace_id
+                )
             else:
                 self.log(f"Unhandled message type: {message.type}", "WARNING")
         except Exception as e:
@@ -64,13 +79,38 @@ class LLMResponseAgent(BaseAgent):
         """Generate response using LLM and retrieved context"""
         payload = message.payload
         query = payload.get('query')
-        retrieved_context = payload.get('retrieved_context', [])
+        # Everything below, sources included, uses only what fits in the prompt
+        retrieved_context = self._select_context(payload.get('retrieved_context', []))
         
         self.log(f"Generating response for query with {len(retrieved_context)} context items")
         
-        # Generate response
+        # Generate response, streaming partial text to the UI as it arrives
+        fallback = not self.llm_available
+        interrupted = False
         if self.llm_available:
-            response = await self._generate_llm_response(query, retrieved_context)
+            parts = []
+            try:
+                async for delta in self._generate_llm_response(query, retrieved_context):
+                    parts.append(delta)
+                    await self.send_message(
+                        receiver="UI",
+                        msg_type=MessageType.PARTIAL_RESPONSE,
+                        payload={
+                            "delta": delta,
+                            "query": query
+                        },
+                        trace_id=message.trace_id
+                    )
+            except Exception as e:
+                self.log(f"LLM generation error: {str(e)}", "ERROR")
+                # Not a complete LLM answer either way; only fall back if nothing reached the user yet
+                fallback = True
+                if parts:
+                    # The user has already seen the start of the answer; flag it as cut short
+                    interrupted = True
+                else:
+                    parts = [self._generate_fallback_response(query, retrieved_context)]
+            response = "".join(parts)
         else:
             response = self._generate_fallback_response(query, retrieved_context)
         
@@ -98,24 +138,22 @@ class LLMResponseAgent(BaseAgent):
             payload={
                 "answer": response,
                 "source_info": source_info,
-                "query": query
+                "query": query,
+                "fallback": fallback,
+                "interrupted": interrupted
             },
             trace_id=message.trace_id
         )
     
-    async def _generate_llm_response(self, query: str, context: list) -> str:
-        """Generate response using Gemini LLM"""
+    async def _generate_llm_response(self, query: str, context: list) -> AsyncIterator[str]:
+        """Stream response text from Gemini LLM; errors are left to the caller"""
         # Prepare context text
         context_text = "\n\n".join([
             f"Source: {item.get('source', 'unknown')}\n{item['text']}"
             for item in context
         ])
         
-        # Create prompt
         prompt = f"""
-Based on the following context from uploaded documents, answer the user's question. 
-Be accurate, concise, and cite the sources when possible.
-
 Context:
 {context_text}
 
@@ -123,13 +161,30 @@ Question: {query}
 
 Answer:
 """
+        response = await self.model.generate_content_async(prompt, stream=True)
         
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            self.log(f"LLM generation error: {str(e)}", "ERROR")
-            return self._generate_fallback_response(query, context)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+    
+    def _select_context(self, context: list) -> list:
+        """Keep the best-scoring context items that fit in the prompt token budget"""
+        budget = self.settings['MAX_CONTEXT_TOKENS']
+        selected = []
+        used = 0
+        
+        # Scores are distances, so lower is better
+        for item in sorted(context, key=lambda item: item.get('score', 0.0)):
+            tokens = len(item['text']) // CHARS_PER_TOKEN + 1
+            if used + tokens > budget:
+                if not selected:
+                    # Even the best item is too long; keep as much of it as fits
+                    selected.append({**item, 'text': item['text'][:max(budget - 1, 0) * CHARS_PER_TOKEN]})
+                break
+            selected.append(item)
+            used += tokens
+        
+        return selected
     
     def _generate_fallback_response(self, query: str, context: list) -> str:
         """Generate fallback response when LLM is not available"""
@@ -1,16 +1,59 @@
 """Retrieval Agent for Vector Search Operations"""
 
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, List
 from agents.base_agent import BaseAgent
 from core.mcp import MCPMessage, MessageType
 from core.vector_store import VectorStore
 
+class BatchingRetriever:
+    """Coalesces concurrent retrievals into a single vector store query"""
+    
+    def __init__(self, vector_store: VectorStore, max_batch: int = 16):
+        self.vector_store = vector_store
+        self.max_batch = max_batch
+        self._queue = None
+        self._task = None
+    
+    async def submit(self, query: str, n_results: int) -> List[Dict[str, Any]]:
+        """Queue a query and wait for its results"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run(self._queue))
+        
+        future = loop.create_future()
+        self._queue.put_nowait((query, n_results, future))
+        return await future
+    
+    async def _run(self, queue: asyncio.Queue) -> None:
+        """Serve queued queries, batching whatever arrived while the last search ran"""
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            queries = [query for query, _, _ in batch]
+            n_results = max(n for _, n, _ in batch)
+            try:
+                results = await asyncio.to_thread(self.vector_store.search_batch, queries, n_results)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, n, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result[:n])
+
 class RetrievalAgent(BaseAgent):
     """Agent responsible for vector storage and retrieval"""
     
     def __init__(self):
         super().__init__("RetrievalAgent")
         self.vector_store = VectorStore()
+        self.retriever = BatchingRetriever(self.vector_store)
     
     async def handle_message(self, message: MCPMessage) -> None:
         """Handle incoming messages"""
@@ -26,15 +69,28 @@ class RetrievalAgent(BaseAgent):
             await self._send_error_message(message, str(e))
     
     async def _ingest_chunks(self, message: MCPMessage) -> None:
-        """Ingest document chunks into vector store"""
+        """Ingest document chunks received over the message bus"""
         payload = message.payload
-        chunks = payload.get('chunks', [])
-        file_name = payload.get('file_name')
+        await self.ingest_chunks(payload.get('chunks', []), payload.get('file_name'))
         
+        # Let the uploader know the document is searchable
+        if payload.get('reply_to'):
+            await self.send_message(
+                receiver=payload['reply_to'],
+                msg_type=MessageType.DOC_INGESTED,
+                payload={
+                    "file_name": payload.get('file_name'),
+                    "total_chunks": payload.get('total_chunks', 0)
+                },
+                trace_id=message.trace_id
+            )
+    
+    async def ingest_chunks(self, chunks: List[Dict[str, Any]], file_name: str) -> None:
+        """Ingest document chunks into vector store"""
         self.log(f"Ingesting {len(chunks)} chunks from {file_name}")
         
-        # Add chunks to vector store
-        self.vector_store.add_documents(chunks)
+        # Add chunks to vector store (embedding is CPU-bound, keep it off the event loop)
+        await asyncio.to_thread(self.vector_store.add_documents, chunks)
         
         # Log statistics
         stats = self.vector_store.get_collection_stats()
@@ -51,8 +107,8 @@ class RetrievalAgent(BaseAgent):
         
         self.log(f"Performing retrieval for query: {query}")
         
-        # Search vector store
-        results = self.vector_store.search(query, n_results)
+        # Search vector store, batched with any concurrent retrievals
+        results = await self.retriever.submit(query, n_results)
         
         self.log(f"Found {len(results)} relevant chunks")
         
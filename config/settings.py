@@ -10,5 +10,10 @@ def get_settings() -> Dict[str, Any]:
         'EMBEDDING_MODEL': os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'),
         'MAX_CHUNK_SIZE': int(os.environ.get('MAX_CHUNK_SIZE', '1000')),
         'RETRIEVAL_TOP_K': int(os.environ.get('RETRIEVAL_TOP_K', '5')),
+        'MAX_CONTEXT_TOKENS': int(os.environ.get('MAX_CONTEXT_TOKENS', '4096')),
+        'RESPONSE_TIMEOUT': float(os.environ.get('RESPONSE_TIMEOUT', '60')),
+        'INGEST_TIMEOUT': float(os.environ.get('INGEST_TIMEOUT', '600')),
+        'MAX_CHAT_HISTORY': int(os.environ.get('MAX_CHAT_HISTORY', '200')),
+        'CHROMA_DIR': os.environ.get('CHROMA_DIR', '.chroma'),
         'DEBUG_MODE': os.environ.get('DEBUG_MODE', 'False').lower() == 'true'
     }
\ No newline at end of file
@@ -3,6 +3,13 @@
 
 from .mcp import MCPMessage, MessageType, message_bus
 from .document_parser import DocumentParser
-from .vector_store import VectorStore
 
 __all__ = ['MCPMessage', 'MessageType', 'message_bus', 'DocumentParser', 'VectorStore']
+
+def __getattr__(name):
+    # VectorStore pulls in torch, chromadb and sentence-transformers; import it on
+    # first use so PDF worker processes, which import this package, stay light
+    if name == 'VectorStore':
+        from .vector_store import VectorStore
+        return VectorStore
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,24 +1,117 @@
 """Document Parser for Multi-Format Support"""
 
 import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 import PyPDF2
 from pptx import Presentation
 import pandas as pd
 from docx import Document
 import markdown
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Union, BinaryIO, Optional
+
+# Raw file contents, or a seekable binary stream over them (e.g. an upload buffer)
+FileData = Union[bytes, BinaryIO]
+
+def _as_stream(file_data: FileData) -> BinaryIO:
+    """Get a binary stream over the file contents, positioned at the start"""
+    if isinstance(file_data, (bytes, bytearray)):
+        return io.BytesIO(file_data)
+    file_data.seek(0)
+    return file_data
+
+def _as_bytes(file_data: FileData) -> bytes:
+    """Get the file contents as bytes"""
+    if isinstance(file_data, (bytes, bytearray)):
+        return file_data
+    if hasattr(file_data, 'getvalue'):
+        return file_data.getvalue()
+    file_data.seek(0)
+    return file_data.read()
+
+# Below this page count, worker start-up and pickling cost more than they save
+PARALLEL_PDF_MIN_PAGES = 8
+
+# Workers stay alive for the life of the process, so keep the pool small
+PDF_WORKERS = min(os.cpu_count() or 1, 4)
+
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """Get the shared process pool used for PDF text extraction"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # Don't fork this multi-threaded process (Streamlit, torch); start clean workers
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                # Import the parsing libraries once in the server, not in every worker
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context)
+        return _pdf_executor
+
+def _drop_pdf_executor(executor: ProcessPoolExecutor) -> None:
+    """Discard a broken process pool so the next PDF starts a new one"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is executor:
+            _pdf_executor = None
+    executor.shutdown(wait=False)
+
+def _extract_pages(args: Tuple[str, int, int]) -> List[str]:
+    """Extract text from a range of PDF pages (runs in a worker process)"""
+    path, start, stop = args
+    pdf_reader = PyPDF2.PdfReader(path)
+    return [pdf_reader.pages[i].extract_text() for i in range(start, stop)]
+
+def _extract_pages_parallel(file_data: FileData, num_pages: int) -> Optional[List[str]]:
+    """Extract the text of every page across the process pool, or None if the pool broke"""
+    # Workers read a temporary copy on disk instead of each being sent the whole file
+    tmp = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+    try:
+        with tmp:
+            shutil.copyfileobj(_as_stream(file_data), tmp)
+        
+        # One contiguous page range per worker, so each parses the file once
+        step = -(-num_pages // PDF_WORKERS)
+        ranges = [(tmp.name, start, min(start + step, num_pages))
+                  for start in range(0, num_pages, step)]
+        executor = _get_pdf_executor()
+        try:
+            return [text for part in executor.map(_extract_pages, ranges) for text in part]
+        except BrokenProcessPool:
+            _drop_pdf_executor(executor)
+            return None
+    finally:
+        os.unlink(tmp.name)
 
 class DocumentParser:
     """Unified document parsing for multiple formats"""
     
     @staticmethod
-    def parse_pdf(file_data: bytes) -> List[Dict[str, Any]]:
+    def parse_pdf(file_data: FileData) -> List[Dict[str, Any]]:
         """Parse PDF and extract text chunks"""
         chunks = []
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_data))
-            for page_num, page in enumerate(pdf_reader.pages, 1):
-                text = page.extract_text()
+            pdf_reader = PyPDF2.PdfReader(_as_stream(file_data))
+            num_pages = len(pdf_reader.pages)
+            
+            texts = None
+            if num_pages >= PARALLEL_PDF_MIN_PAGES and PDF_WORKERS > 1:
+                texts = _extract_pages_parallel(file_data, num_pages)
+            if texts is None:
+                texts = [page.extract_text() for page in pdf_reader.pages]
+            
+            for page_num, text in enumerate(texts, 1):
                 if text.strip():
                     chunks.append({
                         "text": text.strip(),
@@ -30,20 +123,20 @@ class DocumentParser:
         return chunks
     
     @staticmethod
-    def parse_pptx(file_data: bytes) -> List[Dict[str, Any]]:
+    def parse_pptx(file_data: FileData) -> List[Dict[str, Any]]:
         """Parse PPTX and extract slide content"""
         chunks = []
         try:
-            prs = Presentation(io.BytesIO(file_data))
+            prs = Presentation(_as_stream(file_data))
+            chunks_append = chunks.append
             for slide_num, slide in enumerate(prs.slides, 1):
-                slide_text = []
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text:
-                        slide_text.append(shape.text)
+                text = "\n".join(
+                    t for shape in slide.shapes if (t := getattr(shape, "text", ""))
+                )
                 
-                if slide_text:
-                    chunks.append({
-                        "text": "\n".join(slide_text),
+                if text:
+                    chunks_append({
+                        "text": text,
                         "slide": slide_num,
                         "type": "pptx"
                     })
@@ -52,25 +145,29 @@ class DocumentParser:
         return chunks
     
     @staticmethod
-    def parse_csv(file_data: bytes) -> List[Dict[str, Any]]:
+    def parse_csv(file_data: FileData) -> List[Dict[str, Any]]:
         """Parse CSV and convert to text chunks"""
         chunks = []
         try:
-            df = pd.read_csv(io.StringIO(file_data.decode('utf-8')))
+            df = pd.read_csv(_as_stream(file_data), encoding='utf-8')
             
-            # Header chunk
-            chunks.append({
-                "text": f"CSV Headers: {', '.join(df.columns.tolist())}",
-                "row": 0,
-                "type": "csv"
-            })
+            if df.empty:
+                # Header chunk
+                chunks.append({
+                    "text": f"CSV Headers: {', '.join(df.columns.astype(str))}",
+                    "row": 0,
+                    "type": "csv"
+                })
+                return chunks
+            
+            # Render every row once as a CSV line
+            header_line = ",".join(df.columns.astype(str))
+            lines = [",".join(row) for row in df.fillna("").astype(str).to_numpy()]
             
-            # Row chunks (group by 10 rows for efficiency)
-            for i in range(0, len(df), 10):
-                chunk_df = df.iloc[i:i+10]
-                text_repr = chunk_df.to_string(index=False)
+            # Row chunks (group by 10 rows for efficiency), each led by the header
+            for i in range(0, len(lines), 10):
                 chunks.append({
-                    "text": text_repr,
+                    "text": header_line + "\n" + "\n".join(lines[i:i+10]),
                     "row": i+1,
                     "type": "csv"
                 })
@@ -79,15 +176,18 @@ class DocumentParser:
         return chunks
     
     @staticmethod
-    def parse_docx(file_data: bytes) -> List[Dict[str, Any]]:
+    def parse_docx(file_data: FileData) -> List[Dict[str, Any]]:
         """Parse DOCX and extract paragraphs"""
         chunks = []
         try:
-            doc = Document(io.BytesIO(file_data))
+            doc = Document(_as_stream(file_data))
+            chunks_append = chunks.append
             for para_num, paragraph in enumerate(doc.paragraphs, 1):
-                if paragraph.text.strip():
-                    chunks.append({
-                        "text": paragraph.text.strip(),
+                # paragraph.text is rebuilt from the XML runs on every access
+                text = paragraph.text.strip()
+                if text:
+                    chunks_append({
+                        "text": text,
                         "paragraph": para_num,
                         "type": "docx"
                     })
@@ -96,11 +196,11 @@ class DocumentParser:
         return chunks
     
     @staticmethod
-    def parse_text(file_data: bytes, file_extension: str) -> List[Dict[str, Any]]:
+    def parse_text(file_data: FileData, file_extension: str) -> List[Dict[str, Any]]:
         """Parse TXT/MD files"""
         chunks = []
         try:
-            text = file_data.decode('utf-8')
+            text = _as_bytes(file_data).decode('utf-8')
             
             if file_extension == '.md':
                 # Convert markdown to HTML then extract text
@@ -119,24 +219,26 @@ class DocumentParser:
             raise ValueError(f"Text parsing error: {str(e)}")
         return chunks
     
+    # File extension -> parser, built once at class creation
+    _PARSERS = {
+        'pdf': parse_pdf,
+        'pptx': parse_pptx,
+        'csv': parse_csv,
+        'docx': parse_docx,
+        'txt': partial(parse_text, file_extension='.txt'),
+        'md': partial(parse_text, file_extension='.md')
+    }
+    
     @classmethod
-    def parse_document(cls, file_data: bytes, file_name: str) -> List[Dict[str, Any]]:
+    def parse_document(cls, file_data: FileData, file_name: str) -> List[Dict[str, Any]]:
         """Main parsing method - routes to appropriate parser"""
         file_extension = file_name.lower().split('.')[-1]
         
-        parser_map = {
-            'pdf': cls.parse_pdf,
-            'pptx': cls.parse_pptx,
-            'csv': cls.parse_csv,
-            'docx': cls.parse_docx,
-            'txt': lambda data: cls.parse_text(data, '.txt'),
-            'md': lambda data: cls.parse_text(data, '.md')
-        }
-        
-        if file_extension not in parser_map:
+        parser = cls._PARSERS.get(file_extension)
+        if parser is None:
             raise ValueError(f"Unsupported file format: {file_extension}")
         
-        chunks = parser_map[file_extension](file_data)
+        chunks = parser(file_data)
         
         # Add source metadata to all chunks
         for chunk in chunks:
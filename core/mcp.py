@@ -1,12 +1,16 @@
 """Model Context Protocol (MCP) Implementation for Agent Communication"""
 
-import json
-import uuid
-from typing import Dict, Any, Optional
-from dataclasses import dataclass, asdict
-from enum import Enum
 import asyncio
-from collections import defaultdict
+import itertools
+from typing import Dict, Any, Optional, List
+from enum import Enum
+
+# Trace IDs never leave the process, so a counter is unique enough
+_trace_counter = itertools.count(1)
+
+def next_trace_id() -> str:
+    """Get a new process-unique trace ID"""
+    return f"t{next(_trace_counter)}"
 
 class MessageType(Enum):
     DOC_UPLOADED = "DOC_UPLOADED"
@@ -14,58 +18,186 @@ class MessageType(Enum):
     USER_QUERY = "USER_QUERY"
     RETRIEVAL_REQUEST = "RETRIEVAL_REQUEST"
     RETRIEVAL_RESULT = "RETRIEVAL_RESULT"
+    PARTIAL_RESPONSE = "PARTIAL_RESPONSE"
     FINAL_RESPONSE = "FINAL_RESPONSE"
     ERROR = "ERROR"
 
-@dataclass
+_TYPE_VALUES = {m: m.value for m in MessageType}
+
 class MCPMessage:
-    sender: str
-    receiver: str
-    type: MessageType
-    trace_id: str
-    payload: Dict[str, Any]
+    """Message exchanged between agents over the message bus"""
+    
+    __slots__ = ('sender', 'receiver', 'type', 'trace_id', 'payload')
+    
+    def __init__(self, sender: str, receiver: str, type: MessageType,
+                 trace_id: str, payload: Dict[str, Any]):
+        self.init(sender, receiver, type, trace_id, payload)
+    
+    def init(self, sender: str, receiver: str, type: MessageType,
+             trace_id: str, payload: Dict[str, Any]) -> None:
+        """(Re)initialize all fields, e.g. when reusing a pooled message"""
+        self.sender = sender
+        self.receiver = receiver
+        self.type = type
+        self.trace_id = trace_id
+        self.payload = payload
+    
+    def clear(self) -> None:
+        """Drop field references so a pooled message doesn't keep its payload alive"""
+        self.sender = self.receiver = self.type = self.trace_id = self.payload = None
+    
+    def __repr__(self) -> str:
+        return (f"MCPMessage(sender={self.sender!r}, receiver={self.receiver!r}, "
+                f"type={self.type}, trace_id={self.trace_id!r})")
     
     def to_dict(self) -> Dict[str, Any]:
         return {
             "sender": self.sender,
             "receiver": self.receiver,
-            "type": self.type.value,
+            "type": _TYPE_VALUES[self.type],
             "trace_id": self.trace_id,
             "payload": self.payload
         }
 
+# Recycled messages; bounded so a burst of traffic doesn't pin memory
+MESSAGE_POOL_SIZE = 64
+_message_pool: List[MCPMessage] = []
+
+def acquire_message(sender: str, receiver: str, msg_type: MessageType,
+                    trace_id: str, payload: Dict[str, Any]) -> MCPMessage:
+    """Get an initialized message, reusing a pooled one when available"""
+    try:
+        message = _message_pool.pop()
+    except IndexError:
+        return MCPMessage(sender, receiver, msg_type, trace_id, payload)
+    message.init(sender, receiver, msg_type, trace_id, payload)
+    return message
+
+def release_message(message: MCPMessage) -> None:
+    """Return a message to the pool; it must not be used afterwards"""
+    message.clear()
+    if len(_message_pool) < MESSAGE_POOL_SIZE:
+        _message_pool.append(message)
+
+# Independent requests, each handled in its own task so one slow request (e.g. a
+# streaming answer) doesn't hold up the rest and concurrent retrievals can batch.
+# Every other type is delivered strictly in order per receiver
+CONCURRENT_TYPES = frozenset({
+    MessageType.USER_QUERY,
+    MessageType.RETRIEVAL_REQUEST,
+    MessageType.RETRIEVAL_RESULT
+})
+
 class MCPMessageBus:
     """In-memory message bus for agent communication"""
     
+    __slots__ = ('_handlers', '_queues', '_workers', '_tasks', '_loop', '_pending', '_idle')
+    
     def __init__(self):
-        self._subscribers = defaultdict(list)
-        self._message_queue = asyncio.Queue()
         self._handlers = {}
+        # Per-receiver FIFO queues and their delivery tasks, bound to self._loop
+        self._queues = {}
+        self._workers = []
+        # Handlers running concurrently with their receiver's worker
+        self._tasks = set()
+        self._loop = None
+        self._pending = 0
+        self._idle = None
         
     def subscribe(self, agent_name: str, handler_func):
         """Subscribe an agent to receive messages"""
-        self._subscribers[agent_name].append(handler_func)
         self._handlers[agent_name] = handler_func
     
-    async def send_message(self, message: MCPMessage):
-        """Send message to target agent"""
-        await self._message_queue.put(message)
+    def send_message(self, message: MCPMessage) -> None:
+        """Queue message for delivery to target agent"""
+        receiver = message.receiver
+        if receiver not in self._handlers:
+            release_message(message)
+            return
         
-        # Direct delivery to handler
-        if message.receiver in self._handlers:
-            handler = self._handlers[message.receiver]
-            await handler(message)
+        loop = self._loop
+        if loop is None:
+            loop = self._bind()
+        elif loop is not asyncio.get_running_loop():
+            raise RuntimeError("MCPMessageBus is bound to another event loop")
+        
+        queue = self._queues.get(receiver)
+        if queue is None:
+            queue = self._queues[receiver] = asyncio.Queue()
+            self._workers = [worker for worker in self._workers if not worker.done()]
+            self._workers.append(loop.create_task(self._worker(receiver, queue)))
+        
+        self._pending += 1
+        self._idle.clear()
+        queue.put_nowait(message)
+    
+    def _bind(self) -> asyncio.AbstractEventLoop:
+        """Attach the bus to the running event loop, which then owns its queues and workers"""
+        self._loop = asyncio.get_running_loop()
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        return self._loop
+    
+    async def _worker(self, receiver: str, queue: asyncio.Queue) -> None:
+        """Deliver queued messages to one receiver, in order unless in CONCURRENT_TYPES"""
+        try:
+            while True:
+                message = await queue.get()
+                if message.type in CONCURRENT_TYPES:
+                    task = self._loop.create_task(self._deliver(receiver, message))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                else:
+                    await self._deliver(receiver, message)
+        finally:
+            # Stopped by cancellation or a BaseException from a handler: drop the
+            # queue and its undelivered messages so the next send starts a new worker
+            if self._queues.get(receiver) is queue:
+                del self._queues[receiver]
+                while not queue.empty():
+                    release_message(queue.get_nowait())
+                    self._pending -= 1
+                if not self._pending:
+                    self._idle.set()
+    
+    async def _deliver(self, receiver: str, message: MCPMessage) -> None:
+        """Run the receiver's handler on a message
+        
+        The message is recycled once the handler returns, so handlers must
+        not keep a reference to it.
+        """
+        try:
+            await self._handlers[receiver](message)
+        except Exception as e:
+            print(f"[ERROR] MCPMessageBus: {receiver} failed on {message.type}: {str(e)}")
+        finally:
+            release_message(message)
+            self._pending -= 1
+            if not self._pending:
+                self._idle.set()
+    
+    async def join(self) -> None:
+        """Wait until every queued message, including ones sent meanwhile, is handled"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        while self._pending:
+            await self._idle.wait()
+    
+    async def graceful_shutdown(self) -> None:
+        """Finish queued messages, then stop the delivery workers"""
+        await self.join()
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._queues = {}
+        self._loop = None
     
     def create_message(self, sender: str, receiver: str, msg_type: MessageType, 
                       payload: Dict[str, Any], trace_id: Optional[str] = None) -> MCPMessage:
         """Create standardized MCP message"""
-        return MCPMessage(
-            sender=sender,
-            receiver=receiver,
-            type=msg_type,
-            trace_id=trace_id or str(uuid.uuid4()),
-            payload=payload
-        )
+        return acquire_message(sender, receiver, msg_type, trace_id or next_trace_id(), payload)
 
 # Global message bus instance
 message_bus = MCPMessageBus()
\ No newline at end of file
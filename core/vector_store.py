@@ -1,93 +1,294 @@
 """Vector Store Implementation with ChromaDB"""
 
 import chromadb
+import torch
+from chromadb import Documents, EmbeddingFunction, Embeddings
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
+from functools import lru_cache
 from typing import List, Dict, Any, Tuple
-import uuid
+import hashlib
+import threading
+from config.settings import get_settings
+
+COLLECTION_NAME = "documents"
+
+# HNSW parameters tuned for bulk inserts: wider construction search, denser graph,
+# and larger batches between index syncs to disk
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:batch_size": 1000,
+    "hnsw:sync_threshold": 10000
+}
+
+# Maximum number of chunks embedded and written per collection.add call
+ADD_BATCH_SIZE = 512
+
+# Number of recent query embeddings kept per VectorStore
+QUERY_CACHE_SIZE = 256
+
+# Process-wide Chroma client and embedding models shared by every VectorStore
+_CLIENT = None
+_MODELS: Dict[Tuple[str, bool], SentenceTransformer] = {}
+_LOCK = threading.Lock()
+
+def _get_client():
+    """Get the shared ChromaDB client, creating it on first use"""
+    global _CLIENT
+    with _LOCK:
+        if _CLIENT is None:
+            _CLIENT = chromadb.PersistentClient(
+                path=get_settings()['CHROMA_DIR'],
+                settings=Settings(
+                    allow_reset=True,
+                    anonymized_telemetry=False
+                )
+            )
+        return _CLIENT
+
+def _get_model(name: str, quantize: bool) -> SentenceTransformer:
+    """Get a shared embedding model, loading it on first use"""
+    with _LOCK:
+        model = _MODELS.get((name, quantize))
+        if model is None:
+            model = SentenceTransformer(name)
+            if quantize and model.device.type == 'cpu':
+                # int8 dynamic quantization of the Linear layers for faster CPU encoding
+                torch.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+                )
+            _MODELS[(name, quantize)] = model
+        return model
+
+def reset_singletons() -> None:
+    """Drop the shared client and models (and all stored documents), e.g. between tests"""
+    global _CLIENT
+    with _LOCK:
+        if _CLIENT is not None:
+            _CLIENT.reset()
+        _CLIENT = None
+        _MODELS.clear()
+
+class BatchedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Chroma embedding function that encodes a whole batch in one model call"""
+    
+    def __init__(self, model: SentenceTransformer, batch_size: int = 64):
+        self.model = model
+        self.batch_size = batch_size
+    
+    def __call__(self, input: Documents) -> Embeddings:
+        embeddings = self.model.encode(
+            list(input),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        return embeddings.tolist()
 
 class VectorStore:
-    """In-memory vector store using ChromaDB"""
+    """Persistent vector store using ChromaDB"""
     
-    def __init__(self, embedding_model: str = "all-MiniLM-L6-v2"):
-        # Initialize ChromaDB in memory
-        self.client = chromadb.Client(Settings(
-            allow_reset=True,
-            anonymized_telemetry=False
-        ))
+    def __init__(self, embedding_model: str = "all-MiniLM-L6-v2", quantize: bool = True):
+        # Shared on-disk ChromaDB client
+        self.client = _get_client()
         
         # Initialize embedding model
-        self.embedding_model = SentenceTransformer(embedding_model)
+        self.embedding_model = _get_model(embedding_model, quantize)
+        self.embedding_function = BatchedEmbeddingFunction(self.embedding_model)
+        self._embed_query = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._encode_query)
         
         # Create collection
-        self.collection = self.client.get_or_create_collection(
-            name="documents",
-            metadata={"hnsw:space": "cosine"}
+        self.collection = self._get_collection()
+        self._count = self.collection.count()
+        
+        # Bumped whenever the stored chunks change, so callers can tell stale results
+        self.generation = 0
+        
+        # Serializes writes (add, delete, clear), which run on worker threads
+        self._write_lock = threading.Lock()
+        
+        # Content hash -> ID of a stored chunk with that text
+        self._seen: Dict[str, str] = {}
+        self._load_seen()
+    
+    def _get_collection(self):
+        """Get or create the documents collection"""
+        return self.client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            metadata=COLLECTION_METADATA,
+            embedding_function=self.embedding_function
         )
     
+    def _load_seen(self) -> None:
+        """Rebuild the content hash index from chunks already in the collection"""
+        existing = self.collection.get(include=['metadatas'])
+        for chunk_id, metadata in zip(existing['ids'], existing['metadatas']):
+            content_hash = (metadata or {}).get('content_hash')
+            if content_hash:
+                self._seen.setdefault(content_hash, chunk_id)
+    
     def add_documents(self, chunks: List[Dict[str, Any]]) -> None:
         """Add document chunks to vector store"""
         if not chunks:
             return
-            
+        
+        with self._write_lock:
+            self._add_documents(chunks)
+    
+    def _add_documents(self, chunks: List[Dict[str, Any]]) -> None:
+        """Add document chunks; the caller holds the write lock"""
         # Prepare data for ChromaDB
         documents = []
         metadatas = []
+        hashes = []
         ids = []
+        added = set()
+        blake2b = hashlib.blake2b
         
         for chunk in chunks:
-            # Generate unique ID
-            chunk_id = str(uuid.uuid4())
-            
             # Extract text for embedding
             text = chunk['text']
+            content_hash = blake2b(text.encode(), digest_size=16).hexdigest()
+            
+            # Content-derived ID, so re-ingesting a document maps onto the same records
+            chunk_id = blake2b(f"{chunk.get('source', '')}\0{text}".encode(),
+                               digest_size=16).hexdigest()
+            
+            # Skip text repeated within one document (headers, footers, boilerplate)
+            if chunk_id in added:
+                continue
+            added.add(chunk_id)
             
             # Prepare metadata (everything except text)
             metadata = {k: v for k, v in chunk.items() if k != 'text'}
+            metadata['content_hash'] = content_hash
             
             documents.append(text)
             metadatas.append(metadata)
+            hashes.append(content_hash)
             ids.append(chunk_id)
         
-        # Add to collection
-        self.collection.add(
+        # Add to collection in bounded batches
+        for i in range(0, len(documents), ADD_BATCH_SIZE):
+            self._add_batch(
+                documents[i:i+ADD_BATCH_SIZE],
+                metadatas[i:i+ADD_BATCH_SIZE],
+                hashes[i:i+ADD_BATCH_SIZE],
+                ids[i:i+ADD_BATCH_SIZE]
+            )
+        
+        # A re-ingested source replaces its earlier version
+        for source in {metadata.get('source') for metadata in metadatas}:
+            if source:
+                self._delete_stale(source, added)
+    
+    def _delete_stale(self, source: str, current_ids: set) -> None:
+        """Delete a source's stored chunks that aren't among its current chunk IDs"""
+        stored = self.collection.get(where={"source": source}, include=[])['ids']
+        stale = [chunk_id for chunk_id in stored if chunk_id not in current_ids]
+        if not stale:
+            return
+        
+        self.collection.delete(ids=stale)
+        stale = set(stale)
+        self._seen = {h: chunk_id for h, chunk_id in self._seen.items() if chunk_id not in stale}
+        self._count -= len(stale)
+        self.generation += 1
+    
+    def _add_batch(self, documents: List[str], metadatas: List[Dict[str, Any]],
+                   hashes: List[str], ids: List[str]) -> None:
+        """Embed and add one batch, embedding each distinct unseen text only once"""
+        # Drop chunks already stored, e.g. from an earlier upload of the same file
+        stored_ids = set(self.collection.get(ids=ids, include=[])['ids'])
+        if stored_ids:
+            keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in stored_ids]
+            if not keep:
+                return
+            documents = [documents[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            hashes = [hashes[i] for i in keep]
+            ids = [ids[i] for i in keep]
+        
+        embeddings = {}
+        
+        # Reuse the stored embedding of texts already in the collection
+        known = {h: self._seen[h] for h in hashes if h in self._seen}
+        if known:
+            stored = self.collection.get(ids=list(known.values()), include=['embeddings'])
+            by_id = dict(zip(stored['ids'], stored['embeddings']))
+            embeddings = {h: list(map(float, by_id[chunk_id]))
+                          for h, chunk_id in known.items() if chunk_id in by_id}
+        
+        new_texts = {}
+        for content_hash, text in zip(hashes, documents):
+            if content_hash not in embeddings:
+                new_texts.setdefault(content_hash, text)
+        if new_texts:
+            embeddings.update(zip(new_texts, self.embedding_function(list(new_texts.values()))))
+        
+        self.collection.upsert(
             documents=documents,
             metadatas=metadatas,
+            embeddings=[embeddings[h] for h in hashes],
             ids=ids
         )
+        
+        for content_hash, chunk_id in zip(hashes, ids):
+            self._seen.setdefault(content_hash, chunk_id)
+        self._count += len(ids)
+        self.generation += 1
+    
+    def _encode_query(self, query: str) -> Tuple[float, ...]:
+        """Embed a query with the same model and normalization as the documents"""
+        return tuple(self.embedding_function([query])[0])
     
     def search(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
         """Search for relevant documents"""
-        if self.collection.count() == 0:
-            return []
+        return self.search_batch([query], n_results)[0]
+    
+    def search_batch(self, queries: List[str], n_results: int = 5) -> List[List[Dict[str, Any]]]:
+        """Search for relevant documents for several queries in one index query"""
+        if self._count == 0:
+            return [[] for _ in queries]
         
         # Perform similarity search
         results = self.collection.query(
-            query_texts=[query],
-            n_results=min(n_results, self.collection.count())
+            query_embeddings=[list(self._embed_query(query)) for query in queries],
+            n_results=min(n_results, self._count)
         )
         
-        # Format results
-        formatted_results = []
-        for i, doc in enumerate(results['documents'][0]):
-            metadata = results['metadatas'][0][i]
-            
-            result = {
-                'text': doc,
-                'score': results['distances'][0][i] if 'distances' in results else 0.0,
-                **metadata
-            }
-            formatted_results.append(result)
-        
-        return formatted_results
+        # Format results, one list per query
+        all_results = []
+        for q, docs in enumerate(results['documents']):
+            formatted_results = []
+            for i, doc in enumerate(docs):
+                metadata = results['metadatas'][q][i]
+                
+                result = {
+                    'text': doc,
+                    'score': results['distances'][q][i] if 'distances' in results else 0.0,
+                    **metadata
+                }
+                formatted_results.append(result)
+            all_results.append(formatted_results)
+        
+        return all_results
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the collection"""
         return {
-            'total_documents': self.collection.count(),
+            'total_documents': self._count,
             'embedding_model': self.embedding_model.get_sentence_embedding_dimension()
         }
     
     def clear(self) -> None:
         """Clear all documents from the store"""
-        self.client.reset()
\ No newline at end of file
+        with self._write_lock:
+            # The client is shared, so drop only this collection rather than resetting it
+            self.client.delete_collection(COLLECTION_NAME)
+            self.collection = self._get_collection()
+            self._seen.clear()
+            self._count = 0
+            self.generation += 1
\ No newline at end of file
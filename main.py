@@ -6,7 +6,7 @@ import os
 # Add project root to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from ui.streamlit_app import StreamlitApp
+from ui.streamlit_app import get_app
 
 def main():
     """Main function to run the application"""
@@ -14,9 +14,8 @@ def main():
     print("📝 Make sure to set GOOGLE_API_KEY environment variable for full LLM functionality")
     print("🌐 Access the application at: http://localhost:8501")
     
-    # Create and run the Streamlit app
-    app = StreamlitApp()
-    app.run()
+    # Run the shared Streamlit app
+    get_app().run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,6 @@
 # ui/__init__.py
 """Agentic RAG Chatbot - UI Package"""
 
-from .streamlit_app import StreamlitApp
+from .streamlit_app import StreamlitApp, get_app
 
-__all__ = ['StreamlitApp']
+__all__ = ['StreamlitApp', 'get_app']
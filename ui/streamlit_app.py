@@ -2,47 +2,258 @@
 
 import streamlit as st
 import asyncio
-import uuid
-from typing import Dict, Any, List
+import concurrent.futures
+import gc
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache
+from typing import Dict, Any, List, Callable, Optional, BinaryIO, Tuple
 from agents.base_agent import BaseAgent
-from core.mcp import MCPMessage, MessageType, message_bus
+from config.settings import get_settings
+from core.mcp import MCPMessage, MessageType, next_trace_id
+
+# Most traces awaiting a reply kept at once; older ones are dropped
+MAX_PENDING = 128
+
+# Reported for a trace dropped to stay within MAX_PENDING
+_DROPPED_ERROR = "Dropped: too many requests in progress"
+
+# Appended to an answer the LLM stopped producing part way through
+INTERRUPTED_NOTICE = "\n\n⚠️ *Answer interrupted: the language model failed before finishing.*"
+
+# File types accepted by the uploader
+_UPLOAD_TYPES = ('pdf', 'pptx', 'csv', 'docx', 'txt', 'md')
+
+_PAGE_CONFIG = {
+    'page_title': "Agentic RAG Chatbot",
+    'page_icon': "🤖",
+    'layout': "wide"
+}
+
+# Answers to repeated questions are reused for this long (seconds), up to this many
+ANSWER_CACHE_TTL = 3600
+ANSWER_CACHE_SIZE = 256
+
+# Compact source citation; loc_kind is one of _LOC_KINDS or None
+Source = namedtuple('Source', 'document loc_kind loc_val')
+
+# Source location keys, in order of precedence
+_LOC_KINDS = ('page', 'slide', 'row', 'paragraph')
+
+def _to_source(info: Dict[str, Any]) -> Source:
+    """Convert a source_info dict from the LLM agent into a Source"""
+    kind = next((k for k in _LOC_KINDS if k in info), None)
+    return Source(info.get('document', 'unknown'), kind, info[kind] if kind else None)
+
+def _fmt_source(s: Source) -> str:
+    """Render a source citation as markdown"""
+    if s.loc_kind:
+        return f"**{s.document}** ({s.loc_kind.capitalize()} {s.loc_val})"
+    return f"**{s.document}**"
+
+# One instance of each agent per process; imported lazily so the models load on first use.
+# lru_cache keeps them even if Streamlit's resource cache is cleared, which would
+# otherwise build duplicate agents fighting over the same bus subscriptions
+@lru_cache(maxsize=1)
+def _get_retrieval_agent():
+    from agents.retrieval_agent import RetrievalAgent
+    return RetrievalAgent()
+
+@lru_cache(maxsize=1)
+def _get_ingestion_agent():
+    from agents.ingestion_agent import IngestionAgent
+    return IngestionAgent(retrieval_agent=_get_retrieval_agent())
+
+@lru_cache(maxsize=1)
+def _get_llm_response_agent():
+    from agents.llm_response_agent import LLMResponseAgent
+    return LLMResponseAgent()
+
+# The bus and the agents are shared by every session, so all agent work runs on
+# one process-wide event loop in a daemon thread; lru_cache as for the agents
+@lru_cache(maxsize=1)
+def _start_event_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Get the event loop all agent work runs on, started once per process"""
+    return _start_event_loop()
+
+@st.cache_resource
+def get_agents():
+    """Get the backend agents, created once per process and shared by every session"""
+    return _get_ingestion_agent(), _get_retrieval_agent(), _get_llm_response_agent()
+
+class AnswerCache:
+    """Thread-safe LRU of recent answers with a time-to-live"""
+    
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Get a cached response, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, response = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+    
+    def put(self, key: Tuple, response: Dict[str, Any]) -> None:
+        """Cache a response, evicting the least recently used beyond max_size"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+
+@st.cache_resource
+def get_answer_cache() -> AnswerCache:
+    """Process-wide answer cache, keyed on the question and the vector store generation"""
+    return AnswerCache()
 
 class UIAgent(BaseAgent):
     """UI Agent for handling Streamlit interface"""
     
     def __init__(self):
         super().__init__("UI")
-        self.responses = {}
-        self.errors = {}
+        # Trace ID -> future resolved with the final response (or failed with the error)
+        self.pending: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        # Trace ID -> streamed answer text, ended by None once the reply is in
+        self.partials: Dict[str, asyncio.Queue] = {}
     
     async def handle_message(self, message: MCPMessage) -> None:
         """Handle incoming messages from other agents"""
         trace_id = message.trace_id
         
+        # Only queue streamed text here; it is drawn by whoever awaits the reply,
+        # so a failing draw can't take down the bus worker delivering to this agent
+        partials = self.partials.get(trace_id)
+        if message.type == MessageType.PARTIAL_RESPONSE:
+            if partials is not None:
+                partials.put_nowait(message.payload.get('delta', ''))
+            return
+        if partials is not None:
+            partials.put_nowait(None)
+        
+        future = self.pending.get(trace_id)
+        if future is None or future.done():
+            return
+        
         if message.type == MessageType.FINAL_RESPONSE:
-            self.responses[trace_id] = message.payload
+            payload = message.payload
+            payload['source_info'] = [_to_source(info) for info in payload.get('source_info', [])]
+            future.set_result(payload)
+        elif message.type == MessageType.DOC_INGESTED:
+            future.set_result(message.payload)
         elif message.type == MessageType.ERROR:
-            self.errors[trace_id] = message.payload
+            future.set_exception(RuntimeError(message.payload.get('error', 'Unknown error')))
+    
+    def _expect_reply(self, trace_id: str) -> None:
+        """Register a future for the reply to a trace ID"""
+        self.pending[trace_id] = asyncio.get_running_loop().create_future()
+        
+        # Entries normally go once their reply is collected; an interrupted
+        # script run (e.g. a rerun mid-upload) can leave some behind
+        if len(self.pending) > MAX_PENDING:
+            self._evict()
+    
+    def _evict(self) -> None:
+        """Drop the oldest traces beyond MAX_PENDING, answered ones first
+        
+        The agent is shared by every session, so a dropped trace may still be
+        awaited; its waiter is woken and reports _DROPPED_ERROR.
+        """
+        excess = len(self.pending) - MAX_PENDING
+        for trace_id in [t for t, future in self.pending.items() if future.done()][:excess]:
+            del self.pending[trace_id]
+            self.partials.pop(trace_id, None)
+        
+        while len(self.pending) > MAX_PENDING:
+            trace_id, future = self.pending.popitem(last=False)
+            future.cancel()
+            partials = self.partials.pop(trace_id, None)
+            if partials is not None:
+                partials.put_nowait(None)
     
-    async def upload_document(self, file_name: str, file_data: bytes) -> str:
-        """Upload document to ingestion agent"""
-        trace_id = str(uuid.uuid4())
+    async def upload_document(self, file_name: str, file_stream: BinaryIO) -> str:
+        """Upload document to ingestion agent
+        
+        The stream itself is handed over; messages stay in-process, so the
+        contents are never copied into the payload.
+        """
+        trace_id = next_trace_id()
+        self._expect_reply(trace_id)
         
         await self.send_message(
             receiver="IngestionAgent",
             msg_type=MessageType.DOC_UPLOADED,
             payload={
                 "file_name": file_name,
-                "file_data": file_data
+                "file_stream": file_stream
             },
             trace_id=trace_id
         )
         
         return trace_id
     
-    async def ask_question(self, query: str) -> str:
-        """Send user query to LLM response agent"""
-        trace_id = str(uuid.uuid4())
+    async def upload_documents(self, files: List[Tuple[str, BinaryIO]]) -> List[str]:
+        """Upload several documents at once, returning their trace IDs in order"""
+        return list(await asyncio.gather(*[
+            self.upload_document(file_name, file_stream) for file_name, file_stream in files
+        ]))
+    
+    async def upload_documents_and_wait(self, files: List[Tuple[str, BinaryIO]],
+                                        timeout: float) -> List[Optional[str]]:
+        """Upload several documents and wait until they are ingested
+        
+        Returns one entry per file, in order: None once it is ingested,
+        otherwise the error message.
+        """
+        trace_ids = await self.upload_documents(files)
+        futures = [self.pending.get(trace_id) for trace_id in trace_ids]
+        try:
+            live = [f for f in futures if f is not None]
+            if live:
+                await asyncio.wait(live, timeout=timeout)
+            
+            errors = []
+            for future in futures:
+                if future is None or future.cancelled():
+                    errors.append(_DROPPED_ERROR)
+                elif not future.done():
+                    errors.append("Timed out while processing")
+                elif future.exception() is not None:
+                    errors.append(str(future.exception()))
+                else:
+                    errors.append(None)
+            return errors
+        finally:
+            for trace_id in trace_ids:
+                self.discard(trace_id)
+    
+    async def ask_question(self, query: str, stream: bool = False) -> str:
+        """Send user query to LLM response agent, keeping partial text if stream is set"""
+        trace_id = next_trace_id()
+        self._expect_reply(trace_id)
+        if stream:
+            self.partials[trace_id] = asyncio.Queue()
         
         await self.send_message(
             receiver="LLMResponseAgent",
@@ -55,43 +266,85 @@ class UIAgent(BaseAgent):
         
         return trace_id
     
-    def get_response(self, trace_id: str) -> Dict[str, Any]:
-        """Get response for a trace ID"""
-        return self.responses.get(trace_id)
+    async def next_partial(self, trace_id: str) -> Optional[str]:
+        """Wait for the next piece of streamed answer text, or None once the reply is in"""
+        partials = self.partials.get(trace_id)
+        if partials is None:
+            return None
+        return await partials.get()
+    
+    async def get_reply(self, trace_id: str) -> Dict[str, Any]:
+        """Wait for the final response to a question
+        
+        Raises RuntimeError if an agent reports an error or the trace was dropped.
+        """
+        future = self.pending.get(trace_id)
+        if future is None:
+            raise RuntimeError(_DROPPED_ERROR)
+        # Wait without awaiting the future itself, which would cancel it with this task
+        await asyncio.wait([future])
+        if future.cancelled():
+            raise RuntimeError(_DROPPED_ERROR)
+        return future.result()
     
-    def get_error(self, trace_id: str) -> Dict[str, Any]:
-        """Get error for a trace ID"""
-        return self.errors.get(trace_id)
+    def discard(self, trace_id: str) -> None:
+        """Stop tracking a trace ID"""
+        future = self.pending.pop(trace_id, None)
+        if future is not None:
+            future.cancel()
+        self.partials.pop(trace_id, None)
 
 class StreamlitApp:
     """Main Streamlit application"""
     
     def __init__(self):
+        self.settings = get_settings()
         self.ui_agent = UIAgent()
-        self.init_session_state()
     
     def init_session_state(self):
         """Initialize Streamlit session state"""
         if 'messages' not in st.session_state:
-            st.session_state.messages = []
+            # Oldest messages drop off once the history is full
+            st.session_state.messages = deque(maxlen=self.settings['MAX_CHAT_HISTORY'])
         if 'uploaded_files' not in st.session_state:
             st.session_state.uploaded_files = []
-        if 'agents_initialized' not in st.session_state:
-            st.session_state.agents_initialized = False
+        if 'uploaded_file_names' not in st.session_state:
+            st.session_state.uploaded_file_names = set()
+        if 'last_uploader_key' not in st.session_state:
+            st.session_state.last_uploader_key = None
+    
+    def _run(self, coro, timeout: Optional[float] = None):
+        """Run coro on the agent event loop, waiting up to timeout seconds for its result"""
+        future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise asyncio.TimeoutError() from None
+        finally:
+            # No-op once done; otherwise stop work nobody waits for any more
+            future.cancel()
+    
+    def _ask(self, query: str, on_partial: Callable[[str], None]) -> Dict[str, Any]:
+        """Ask a question, passing the answer text to on_partial as it streams in
+        
+        Raises RuntimeError if an agent reports an error and asyncio.TimeoutError
+        if no response arrives within RESPONSE_TIMEOUT seconds.
+        """
+        ui_agent = self.ui_agent
+        deadline = time.monotonic() + self.settings['RESPONSE_TIMEOUT']
+        trace_id = self._run(ui_agent.ask_question(query, stream=True))
+        try:
+            # Streamlit calls are only allowed on the script thread, so draw from here
+            while (delta := self._run(ui_agent.next_partial(trace_id),
+                                      max(0.0, deadline - time.monotonic()))) is not None:
+                on_partial(delta)
+            return self._run(ui_agent.get_reply(trace_id))
+        finally:
+            get_event_loop().call_soon_threadsafe(ui_agent.discard, trace_id)
     
     def initialize_agents(self):
         """Initialize all agents"""
-        if not st.session_state.agents_initialized:
-            from agents.ingestion_agent import IngestionAgent
-            from agents.retrieval_agent import RetrievalAgent
-            from agents.llm_response_agent import LLMResponseAgent
-            
-            # Create agents
-            st.session_state.ingestion_agent = IngestionAgent()
-            st.session_state.retrieval_agent = RetrievalAgent()
-            st.session_state.llm_response_agent = LLMResponseAgent()
-            
-            st.session_state.agents_initialized = True
+        self.ingestion_agent, self.retrieval_agent, self.llm_response_agent = get_agents()
     
     def render_sidebar(self):
         """Render sidebar with file upload and settings"""
@@ -99,29 +352,37 @@ class StreamlitApp:
         
         uploaded_files = st.sidebar.file_uploader(
             "Choose files",
-            type=['pdf', 'pptx', 'csv', 'docx', 'txt', 'md'],
+            type=_UPLOAD_TYPES,
             accept_multiple_files=True
         )
         
-        if uploaded_files:
-            for uploaded_file in uploaded_files:
-                if uploaded_file.name not in [f['name'] for f in st.session_state.uploaded_files]:
-                    # Process file upload
-                    file_data = uploaded_file.read()
-                    
-                    # Upload to ingestion agent
-                    trace_id = asyncio.run(self.ui_agent.upload_document(
-                        uploaded_file.name, file_data
-                    ))
-                    
-                    # Add to session state
+        # Skip the upload path entirely unless the uploader's selection changed
+        uploader_key = tuple((f.name, f.size) for f in (uploaded_files or []))
+        if uploader_key != st.session_state.last_uploader_key:
+            new_files = {f.name: f for f in (uploaded_files or [])
+                         if f.name not in st.session_state.uploaded_file_names}
+            
+            if new_files:
+                # Upload all new files to the ingestion agent in one round trip
+                errors = self._run(self.ui_agent.upload_documents_and_wait(
+                    list(new_files.items()), self.settings['INGEST_TIMEOUT']
+                ))
+                st.session_state._needs_gc = True
+                
+                for uploaded_file, error in zip(new_files.values(), errors):
+                    # Add to session state (failed files too, so they aren't retried every rerun)
                     st.session_state.uploaded_files.append({
                         'name': uploaded_file.name,
-                        'size': len(file_data),
-                        'trace_id': trace_id
+                        'size': uploaded_file.size
                     })
+                    st.session_state.uploaded_file_names.add(uploaded_file.name)
                     
-                    st.sidebar.success(f"✅ {uploaded_file.name} uploaded")
+                    if error:
+                        st.sidebar.error(f"❌ {uploaded_file.name}: {error}")
+                    else:
+                        st.sidebar.success(f"✅ {uploaded_file.name} uploaded")
+            
+            st.session_state.last_uploader_key = uploader_key
         
         # Display uploaded files
         if st.session_state.uploaded_files:
@@ -133,7 +394,11 @@ class StreamlitApp:
         st.sidebar.subheader("⚙️ Settings")
         if st.sidebar.button("Clear All Documents"):
             st.session_state.uploaded_files = []
-            st.session_state.retrieval_agent.clear_store()
+            st.session_state.uploaded_file_names = set()
+            st.session_state.last_uploader_key = None
+            # On the agent loop's worker threads, like every other store operation
+            self._run(asyncio.to_thread(self.retrieval_agent.clear_store))
+            get_answer_cache().clear()
             st.sidebar.success("Documents cleared")
     
     def render_chat_interface(self):
@@ -147,19 +412,9 @@ class StreamlitApp:
                 st.markdown(message["content"])
                 
                 # Display sources if available
-                if message.get("sources"):
+                if message.get("source_md"):
                     with st.expander("📚 Sources"):
-                        for source in message["sources"]:
-                            source_text = f"**{source['document']}**"
-                            if 'page' in source:
-                                source_text += f" (Page {source['page']})"
-                            elif 'slide' in source:
-                                source_text += f" (Slide {source['slide']})"
-                            elif 'row' in source:
-                                source_text += f" (Row {source['row']})"
-                            elif 'paragraph' in source:
-                                source_text += f" (Paragraph {source['paragraph']})"
-                            
+                        for source_text in message["source_md"]:
                             st.markdown(source_text)
         
         # Chat input
@@ -174,26 +429,35 @@ class StreamlitApp:
             # Process question
             with st.chat_message("assistant"):
                 with st.spinner("Thinking..."):
-                    trace_id = asyncio.run(self.ui_agent.ask_question(prompt))
+                    # Render the answer as it streams in
+                    placeholder = st.empty()
+                    streamed = []
                     
-                    # Wait for response
-                    response = None
+                    def show_partial(delta: str) -> None:
+                        streamed.append(delta)
+                        placeholder.markdown("".join(streamed) + "▌")
+                    
+                    # Same question over the same stored chunks: reuse the earlier answer.
+                    # The store is shared by every session, so key on its contents
+                    cache_key = (prompt, self.retrieval_agent.vector_store.generation)
+                    answer_cache = get_answer_cache()
+                    response = answer_cache.get(cache_key)
                     error = None
-                    max_attempts = 50
-                    attempts = 0
                     
-                    while attempts < max_attempts:
-                        response = self.ui_agent.get_response(trace_id)
-                        error = self.ui_agent.get_error(trace_id)
-                        
-                        if response or error:
-                            break
-                        
-                        asyncio.run(asyncio.sleep(0.1))
-                        attempts += 1
+                    if response is None:
+                        st.session_state._needs_gc = True
+                        try:
+                            response = self._ask(prompt, show_partial)
+                            if not response.get('fallback'):
+                                answer_cache.put(cache_key, response)
+                        except RuntimeError as e:
+                            error = str(e)
+                        except asyncio.TimeoutError:
+                            pass
                     
                     if error:
-                        error_msg = f"❌ Error: {error.get('error', 'Unknown error')}"
+                        placeholder.empty()
+                        error_msg = f"❌ Error: {error}"
                         st.error(error_msg)
                         st.session_state.messages.append({
                             "role": "assistant", 
@@ -201,32 +465,25 @@ class StreamlitApp:
                         })
                     elif response:
                         answer = response.get('answer', 'No answer generated')
-                        sources = response.get('source_info', [])
+                        if response.get('interrupted'):
+                            answer += INTERRUPTED_NOTICE
+                        source_md = [_fmt_source(source) for source in response.get('source_info', [])]
                         
-                        st.markdown(answer)
+                        placeholder.markdown(answer)
                         
                         # Display sources
-                        if sources:
+                        if source_md:
                             with st.expander("📚 Sources"):
-                                for source in sources:
-                                    source_text = f"**{source['document']}**"
-                                    if 'page' in source:
-                                        source_text += f" (Page {source['page']})"
-                                    elif 'slide' in source:
-                                        source_text += f" (Slide {source['slide']})"
-                                    elif 'row' in source:
-                                        source_text += f" (Row {source['row']})"
-                                    elif 'paragraph' in source:
-                                        source_text += f" (Paragraph {source['paragraph']})"
-                                    
+                                for source_text in source_md:
                                     st.markdown(source_text)
                         
                         st.session_state.messages.append({
                             "role": "assistant", 
                             "content": answer,
-                            "sources": sources
+                            "source_md": source_md
                         })
                     else:
+                        placeholder.empty()
                         timeout_msg = "⏰ Request timed out. Please try again."
                         st.error(timeout_msg)
                         st.session_state.messages.append({
@@ -236,18 +493,30 @@ class StreamlitApp:
     
     def run(self):
         """Run the Streamlit application"""
-        st.set_page_config(
-            page_title="Agentic RAG Chatbot",
-            page_icon="🤖",
-            layout="wide"
-        )
+        # The browser keeps the page config for the session; set it on the first run only
+        if not st.session_state.get('_page_configured'):
+            st.set_page_config(**_PAGE_CONFIG)
+            st.session_state._page_configured = True
         
+        # The app is shared across reruns and sessions; the state below is per session.
+        # _needs_gc is set when this run handled an upload or a question
+        st.session_state._needs_gc = False
+        self.init_session_state()
         self.initialize_agents()
         
         self.render_sidebar()
         self.render_chat_interface()
+        
+        # Free the run's parsed documents and payloads now rather than at the next gen-2 pass
+        if st.session_state._needs_gc:
+            gc.collect()
+
+# No spinner: it would be drawn before run() calls st.set_page_config, which must come first
+@st.cache_resource(show_spinner=False)
+def get_app() -> StreamlitApp:
+    """Get the app, created once per process so the UI agent survives reruns"""
+    return StreamlitApp()
 
-# Create and run the app
+# Streamlit executes the whole script on every rerun
 if __name__ == "__main__":
-    app = StreamlitApp()
-    app.run()
\ No newline at end of file
+    get_app().run()
\ No newline at end of file